@@ -2,20 +2,44 @@ import streamlit as st
 import zipfile 
 import os 
 import io 
-from pptx import Presentation 
-from pptx.enum.shapes import PP_PLACEHOLDER, MSO_SHAPE_TYPE 
+import csv 
+import json 
 import shutil 
-from pptx.util import Inches 
+import tempfile 
 import random 
+import hashlib 
+import threading 
+from collections import OrderedDict, deque 
+from concurrent.futures import ThreadPoolExecutor 
+ 
+# ملاحظة: مكتبة python-pptx (ومعها lxml و Pillow) تُستورد داخل دوال البناء فقط، 
+# حتى لا تدفع كل جلسة جديدة تكلفة الاستيراد قبل أي إجراء من المستخدم 
  
 # إعداد صفحة Streamlit 
 st.set_page_config(page_title="PowerPoint Image Replacer", layout="centered") 
 st.title("🔄 PowerPoint Image & Placeholder Replacer") 
 st.markdown("---") 
  
+# وضع التشغيل 
+processing_mode = st.radio( 
+    "وضع التشغيل", 
+    ("عرض تقديمي واحد", "دفعة (عدة عروض من ملف وصف واحد)"), 
+    index=0, 
+    horizontal=True 
+) 
+batch_mode = processing_mode.startswith("دفعة") 
+ 
 # واجهة المستخدم لرفع الملفات 
-uploaded_pptx = st.file_uploader("📂 اختر ملف PowerPoint (.pptx)", type=["pptx"], key="pptx_uploader") 
-uploaded_zip = st.file_uploader("🗜️ اختر ملف ZIP يحتوي على مجلدات صور", type=["zip"], key="zip_uploader") 
+if batch_mode: 
+    uploaded_pptx = None 
+    uploaded_zip = st.file_uploader("🗜️ اختر ملف ZIP يحتوي على مجلدات الصور (ويمكن أن يحتوي على القوالب وملف الوصف)", type=["zip"], key="batch_zip_uploader") 
+    uploaded_manifest = st.file_uploader("🧾 ملف الوصف (CSV أو JSON) - اختياري إذا كان داخل ملف ZIP", type=["csv", "json"], key="manifest_uploader") 
+    uploaded_templates = st.file_uploader("📂 قوالب PowerPoint إضافية (.pptx) - اختياري", type=["pptx"], accept_multiple_files=True, key="templates_uploader") 
+else: 
+    uploaded_pptx = st.file_uploader("📂 اختر ملف PowerPoint (.pptx)", type=["pptx"], key="pptx_uploader") 
+    uploaded_zip = st.file_uploader("🗜️ اختر ملف ZIP يحتوي على مجلدات صور", type=["zip"], key="zip_uploader") 
+    uploaded_manifest = None 
+    uploaded_templates = [] 
  
 # خيارات المعالجة 
 st.markdown("### ⚙️ إعدادات المعالجة") 
@@ -25,6 +49,21 @@ image_order_option = st.radio(
     index=0 
 ) 
  
+with st.expander("💾 إعدادات الحفظ"): 
+    store_media_option = st.checkbox( 
+        "تخزين الصور المضغوطة مسبقاً (JPEG/PNG...) بدون إعادة ضغط", 
+        value=True 
+    ) 
+    xml_compresslevel_option = st.slider( 
+        "مستوى ضغط ملفات XML (0 = بدون ضغط، 9 = أقصى ضغط)", 
+        min_value=0, max_value=9, value=6 
+    ) 
+    parallel_save_option = st.checkbox( 
+        "تجهيز أجزاء الملف بالتوازي أثناء الحفظ (تجريبي)", 
+        value=False, 
+        help="خيار تجريبي: لم يُظهر تحسناً ملحوظاً في القياسات، وقد يفيد فقط مع الأجهزة متعددة الأنوية" 
+    ) 
+ 
 # إنشاء قائمة لحفظ التفاصيل 
 if 'processing_details' not in st.session_state: 
     st.session_state.processing_details = [] 
@@ -74,6 +113,8 @@ def analyze_first_slide(prs):
     """ 
     تحليل الشريحة الأولى: إرجاع نتائج حتى لو لم توجد مواضع للصور. 
     """ 
+    from pptx.enum.shapes import PP_PLACEHOLDER, MSO_SHAPE_TYPE 
+ 
     if len(prs.slides) == 0: 
         return False, "لا توجد شرائح في الملف" 
  
@@ -182,6 +223,8 @@ def get_image_shapes_info(slide):
     """ 
     استخراج معلومات مفصلة عن أشكال الصور من الشريحة مع التنسيقات 
     """ 
+    from pptx.enum.shapes import PP_PLACEHOLDER, MSO_SHAPE_TYPE 
+ 
     image_shapes_info = [] 
      
     # البحث عن placeholders للصور 
@@ -220,6 +263,8 @@ def get_template_image_positions(slide):
     """ 
     استخراج مواقع الصور من القالب مع التنسيقات الكاملة 
     """ 
+    from pptx.enum.shapes import PP_PLACEHOLDER, MSO_SHAPE_TYPE 
+ 
     image_positions = [] 
      
     # استخدام نفس الطريقة من الكود المرجعي مع إضافة التنسيقات 
@@ -237,6 +282,17 @@ def get_template_image_positions(slide):
     return image_positions 
  
  
+# امتدادات الصور المدعومة 
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.gif', '.bmp', '.tiff', '.webp') 
+ 
+ 
+def list_folder_images(folder_path): 
+    """ 
+    إرجاع أسماء ملفات الصور الموجودة في المجلد 
+    """ 
+    return [f for f in os.listdir(folder_path) if f.lower().endswith(IMAGE_EXTENSIONS)] 
+ 
+ 
 def replace_image_in_shape(slide, shape_info, image_path): 
     """ 
     استبدال صورة في شكل محدد مع الحفاظ على التنسيقات الأصلية 
@@ -345,6 +401,9 @@ def add_title_to_slide(slide, folder_name):
     """ 
     إضافة أو تحديث عنوان الشريحة 
     """ 
+    from pptx.enum.shapes import PP_PLACEHOLDER 
+    from pptx.util import Inches 
+ 
     try: 
         # البحث عن placeholder للعنوان 
         title_shapes = [ 
@@ -375,20 +434,21 @@ def add_title_to_slide(slide, folder_name):
         add_detail(f"⚠ خطأ في معالجة العنوان: {e}", "warning") 
  
  
-def process_folder_images(slide, folder_path, folder_name, template_shapes_info, template_positions, mismatch_action): 
+def process_folder_images(slide, folder_path, folder_name, template_shapes_info, template_positions, mismatch_action, image_order): 
     """ 
     معالجة صور مجلد واحد وإضافتها للشريحة مع الحفاظ على التنسيقات 
     """ 
+    from pptx.util import Inches 
+ 
     # الحصول على قائمة الصور 
-    imgs = [f for f in os.listdir(folder_path)  
-            if f.lower().endswith(('.png', '.jpg', '.jpeg', '.gif', '.bmp', '.tiff', '.webp'))] 
+    imgs = list_folder_images(folder_path) 
      
     if not imgs: 
         add_detail(f"⚠ المجلد {folder_name} فارغ من الصور", "warning") 
         return 0 
      
     # ترتيب الصور بناءً على اختيار المستخدم 
-    if image_order_option == "عشوائي": 
+    if image_order == "عشوائي": 
         random.shuffle(imgs) 
         add_detail(f"🔀 تم ترتيب صور المجلد {folder_name} عشوائياً", "info") 
     else: 
@@ -456,12 +516,562 @@ def process_folder_images(slide, folder_path, folder_name, template_shapes_info,
     return replaced_count 
  
  
+def find_image_folders(root_dir): 
+    """ 
+    إرجاع مسارات المجلدات التي تحتوي على صور (مرتبة أبجدياً) 
+    """ 
+    folder_paths = [] 
+    for item in os.listdir(root_dir): 
+        item_path = os.path.join(root_dir, item) 
+        if os.path.isdir(item_path): 
+            imgs_in_folder = list_folder_images(item_path) 
+            if imgs_in_folder: 
+                folder_paths.append(item_path) 
+                add_detail(f"📁 المجلد '{item}' يحتوي على {len(imgs_in_folder)} صورة", "info") 
+    folder_paths.sort() 
+    return folder_paths 
+ 
+ 
+def prepare_template(prs, analysis_result): 
+    """ 
+    استخراج أشكال ومواقع الصور من الشريحة الأولى واختيار تخطيط الشرائح الجديدة 
+    """ 
+    first_slide = prs.slides[0] 
+    template_shapes_info = get_image_shapes_info(first_slide) 
+    template_positions = get_template_image_positions(first_slide) 
+ 
+    if not template_shapes_info and not template_positions: 
+        add_detail("⚠ الشريحة الأولى لا تحتوي على مواضع صور", "warning") 
+        slide_layout = prs.slide_layouts[6]  # Blank layout 
+    else: 
+        slide_layout = analysis_result['slide_layout'] 
+ 
+    return template_shapes_info, template_positions, slide_layout 
+ 
+ 
+def find_mismatch_folders(folder_paths, expected_count): 
+    """ 
+    إرجاع المجلدات التي يختلف عدد صورها عن عدد مواضع الصور في القالب 
+    """ 
+    mismatch_folders = [] 
+    for fp in folder_paths: 
+        imgs = list_folder_images(fp) 
+        if len(imgs) != expected_count: 
+            mismatch_folders.append((os.path.basename(fp), len(imgs), expected_count)) 
+    return mismatch_folders 
+ 
+ 
+def build_deck(prs, folder_paths, slide_layout, template_shapes_info, template_positions, 
+               mismatch_action, image_order, on_progress=None): 
+    """ 
+    إضافة شريحة لكل مجلد صور، وإرجاع (عدد الشرائح المضافة، عدد الصور المستبدلة) 
+    """ 
+    total_replaced = 0 
+    created_slides = 0 
+ 
+    for folder_idx, folder_path in enumerate(folder_paths): 
+        folder_name = os.path.basename(folder_path) 
+        if on_progress: 
+            on_progress(folder_idx, folder_name) 
+        add_detail(f"🔄 بدء معالجة المجلد: {folder_name}", "info") 
+ 
+        try: 
+            # إنشاء شريحة جديدة 
+            new_slide = prs.slides.add_slide(slide_layout) 
+            created_slides += 1 
+            add_detail(f"📄 تم إنشاء شريحة جديدة للمجلد: {folder_name}", "success") 
+ 
+            # معالجة صور المجلد مع الحفاظ على التنسيقات 
+            replaced_count = process_folder_images( 
+                new_slide, folder_path, folder_name, 
+                template_shapes_info, template_positions, mismatch_action, 
+                image_order 
+            ) 
+ 
+            total_replaced += replaced_count 
+            add_detail(f"✅ تم إنشاء شريحة للمجلد '{folder_name}' واستبدال {replaced_count} صورة", "success") 
+ 
+        except Exception as e: 
+            add_detail(f"❌ خطأ في معالجة المجلد {folder_name}: {e}", "error") 
+ 
+    if on_progress: 
+        on_progress(len(folder_paths), None) 
+ 
+    return created_slides, total_replaced 
+ 
+ 
+# امتدادات الوسائط المضغوطة أصلاً، لا فائدة من إعادة ضغطها عند الحفظ 
+PRECOMPRESSED_MEDIA_EXTENSIONS = ( 
+    '.jpg', '.jpeg', '.png', '.gif', '.webp', 
+    '.mp3', '.m4a', '.wma', '.mp4', '.m4v', '.mov', '.wmv', '.avi' 
+) 
+ 
+ 
+class PackageZipWriter: 
+    """ 
+    كاتب ZIP لأجزاء الحزمة مع التحكم في ضغط كل جزء 
+    """ 
+    def __init__(self, output, xml_compresslevel=6, store_media=True): 
+        self.zip_file = zipfile.ZipFile(output, "w", compression=zipfile.ZIP_DEFLATED) 
+        self.xml_compresslevel = xml_compresslevel 
+        self.store_media = store_media 
+ 
+    def __enter__(self): 
+        return self 
+ 
+    def __exit__(self, *exc): 
+        self.zip_file.close() 
+ 
+    def write(self, pack_uri, blob): 
+        """كتابة جزء واحد: الوسائط المضغوطة تُخزن كما هي، والباقي يُضغط بالمستوى المحدد""" 
+        if self.store_media and pack_uri.lower().endswith(PRECOMPRESSED_MEDIA_EXTENSIONS): 
+            self.zip_file.writestr(pack_uri.membername, blob, compress_type=zipfile.ZIP_STORED) 
+        elif self.xml_compresslevel == 0: 
+            self.zip_file.writestr(pack_uri.membername, blob, compress_type=zipfile.ZIP_STORED) 
+        else: 
+            self.zip_file.writestr(pack_uri.membername, blob, compresslevel=self.xml_compresslevel) 
+ 
+ 
+# عدد الخيوط وعدد الأجزاء المُجهزة مسبقاً في وضع الحفظ المتوازي (لتقييد استهلاك الذاكرة) 
+PARALLEL_SAVE_WORKERS = 2 
+PARALLEL_SAVE_WINDOW = 4 
+ 
+ 
+def resolve_package_writer(prs): 
+    """ 
+    تجهيز ما يلزم من python-pptx للحفظ المخصص (يعتمد على واجهات داخلية قد تتغير بين الإصدارات)، 
+    وإرجاع (الأجزاء، دالة كتابة [Content_Types].xml، دالة كتابة _rels/.rels) 
+    """ 
+    from pptx.opc.serialized import PackageWriter 
+ 
+    package = prs.part.package 
+    parts = tuple(package.iter_parts()) 
+    # يُستخدم PackageWriter فقط لتوليد [Content_Types].xml و _rels/.rels، والكتابة تتم عبر zip_writer 
+    package_writer = PackageWriter(None, package._rels, parts) 
+    return parts, package_writer._write_content_types_stream, package_writer._write_pkg_rels 
+ 
+ 
+def write_package(output, parts, write_content_types, write_pkg_rels, 
+                  xml_compresslevel=6, store_media=True, parallel=False): 
+    """ 
+    كتابة حزمة العرض بكاتب ZIP مخصص 
+    """ 
+    with PackageZipWriter(output, xml_compresslevel, store_media) as zip_writer: 
+        write_content_types(zip_writer) 
+        write_pkg_rels(zip_writer) 
+ 
+        def write_part(part, blob): 
+            zip_writer.write(part.partname, blob) 
+            if len(part.rels): 
+                zip_writer.write(part.partname.rels_uri, part.rels.xml) 
+ 
+        if parallel: 
+            # تحويل الأجزاء إلى بايتات في خيوط منفصلة بينما يضغط الخيط الرئيسي ما سبقها، 
+            # مع نافذة محدودة حتى لا تُحفظ كل الأجزاء في الذاكرة قبل كتابتها 
+            with ThreadPoolExecutor(max_workers=PARALLEL_SAVE_WORKERS) as executor: 
+                pending = deque() 
+                for part in parts: 
+                    pending.append((part, executor.submit(lambda p: p.blob, part))) 
+                    if len(pending) >= PARALLEL_SAVE_WINDOW: 
+                        queued_part, blob_future = pending.popleft() 
+                        write_part(queued_part, blob_future.result()) 
+                while pending: 
+                    queued_part, blob_future = pending.popleft() 
+                    write_part(queued_part, blob_future.result()) 
+        else: 
+            for part in parts: 
+                write_part(part, part.blob) 
+ 
+ 
+def save_presentation(prs, output, xml_compresslevel=6, store_media=True, parallel=False): 
+    """ 
+    حفظ العرض التقديمي مع التحكم في الضغط وإمكانية تجهيز الأجزاء بالتوازي، 
+    مع الرجوع إلى prs.save إذا تغيرت الواجهات الداخلية لـ python-pptx 
+    """ 
+    try: 
+        parts, write_content_types, write_pkg_rels = resolve_package_writer(prs) 
+    except (ImportError, AttributeError, TypeError) as e: 
+        add_detail(f"⚠ تعذر تطبيق إعدادات الحفظ مع إصدار python-pptx الحالي، تم الحفظ بالإعدادات الافتراضية: {e}", "warning") 
+        prs.save(output) 
+        return 
+ 
+    write_package( 
+        output, parts, write_content_types, write_pkg_rels, 
+        xml_compresslevel, store_media, parallel 
+    ) 
+ 
+ 
+def parse_presentation(template_bytes): 
+    """ 
+    تحليل ملف PowerPoint من البايتات (يتم استيراد python-pptx هنا فقط) 
+    """ 
+    from pptx import Presentation 
+ 
+    return Presentation(io.BytesIO(template_bytes)) 
+ 
+ 
+class TemplatePool: 
+    """ 
+    مخزن للقوالب يبقى دافئاً طوال عمر العملية: عند تكرار استخدام قالب (أو عند توقع 
+    تكراره كما في وضع الدفعة) يتم تحليل نسخته التالية في الخلفية لتكون جاهزة فوراً. 
+ 
+    reuse_expected في checkout: None = الاعتماد على عدد مرات الاستخدام، True = تجهيز نسخة 
+    تالية دائماً، False = عدم التجهيز وعدم احتساب هذا الاستخدام (مثل إعادة تشغيل نفس الطلب). 
+ 
+    تكلفة الذاكرة: نسخة محللة واحدة كحد أقصى لكل قالب من آخر max_templates قوالب، 
+    أي حتى max_templates عرضاً محللاً كاملاً مشتركاً بين جميع الجلسات طوال عمر العملية. 
+    القوالب المستخدمة مرة واحدة لا يُحتفظ إلا بعدد مرات استخدامها. 
+    """ 
+    def __init__(self, max_templates=4): 
+        self.max_templates = max_templates 
+        self.templates = OrderedDict() 
+        self.lock = threading.Lock() 
+        self.executor = ThreadPoolExecutor(max_workers=1) 
+ 
+    def checkout(self, template_bytes, reuse_expected=None): 
+        """إرجاع نسخة جديدة قابلة للتعديل من القالب، وتجهيز النسخة التالية فقط إذا تكرر استخدامه""" 
+        key = hashlib.sha1(template_bytes).hexdigest() 
+ 
+        with self.lock: 
+            entry = self.templates.pop(key, None) or {'uses': 0, 'ready': None} 
+            if reuse_expected is not False: 
+                entry['uses'] += 1 
+            warm_copy, entry['ready'] = entry['ready'], None 
+            if reuse_expected or (reuse_expected is None and entry['uses'] > 1): 
+                entry['ready'] = self.executor.submit(parse_presentation, template_bytes) 
+            self.templates[key] = entry 
+ 
+            while len(self.templates) > self.max_templates: 
+                _, evicted = self.templates.popitem(last=False) 
+                if evicted['ready'] is not None: 
+                    evicted['ready'].cancel() 
+ 
+        if warm_copy is not None: 
+            try: 
+                return warm_copy.result() 
+            except Exception: 
+                pass 
+        return parse_presentation(template_bytes) 
+ 
+ 
+@st.cache_resource 
+def get_template_pool(): 
+    """مخزن القوالب المشترك بين جميع الجلسات والتشغيلات في نفس العملية""" 
+    return TemplatePool() 
+ 
+ 
+@st.cache_resource 
+def warm_up_worker(): 
+    """ 
+    استيراد المكتبات الثقيلة مرة واحدة في الخلفية عند بدء العملية، 
+    حتى لا يدفع أول طلب معالجة تكلفة الاستيراد 
+    """ 
+    def _import_build_dependencies(): 
+        import pptx.api 
+        import pptx.enum.shapes 
+        import pptx.opc.serialized 
+        import pptx.parts.image 
+ 
+    thread = threading.Thread(target=_import_build_dependencies, daemon=True) 
+    thread.start() 
+    return thread 
+ 
+ 
+# خيارات وضع الدفعة 
+BATCH_MANIFEST_NAMES = ('manifest.json', 'manifest.csv') 
+BATCH_MISMATCH_ACTIONS = ('truncate', 'repeat', 'skip_folder', 'stop') 
+BATCH_IMAGE_ORDERS = {'sorted': "بالترتيب (افتراضي)", 'random': "عشوائي"} 
+ 
+ 
+def load_batch_manifest(file_name, data, default_image_order): 
+    """ 
+    قراءة ملف الوصف (CSV أو JSON) وإرجاع قائمة العروض المطلوب إنشاؤها 
+    """ 
+    text = data.decode('utf-8-sig') 
+    if file_name.lower().endswith('.json'): 
+        entries = json.loads(text) 
+        if isinstance(entries, dict): 
+            entries = entries.get('decks', []) 
+        if not isinstance(entries, list): 
+            raise ValueError("ملف JSON يجب أن يكون قائمة عروض أو كائناً يحتوي على decks") 
+    else: 
+        entries = list(csv.DictReader(io.StringIO(text))) 
+ 
+    jobs = [] 
+    output_names = set() 
+    for idx, entry in enumerate(entries, start=1): 
+        if not isinstance(entry, dict): 
+            raise ValueError(f"العنصر {idx} في ملف الوصف غير صالح") 
+ 
+        output = str(entry.get('output') or '').strip() 
+        template = str(entry.get('template') or '').strip() 
+        if not output or not template: 
+            raise ValueError(f"العنصر {idx} في ملف الوصف يجب أن يحتوي على output و template") 
+        # اسم الملف الناتج يجب أن يكون اسماً بسيطاً حتى لا يُكتب خارج مجلد الاستخراج 
+        if any(separator in output for separator in ('/', '\\', ':')) or not output.strip('.'): 
+            raise ValueError(f"اسم الملف الناتج غير صالح في العنصر {idx}: {output}") 
+        if not output.lower().endswith('.pptx'): 
+            output += '.pptx' 
+        if output.lower() in output_names: 
+            raise ValueError(f"اسم الملف الناتج مكرر في ملف الوصف: {output}") 
+        output_names.add(output.lower()) 
+ 
+        folders = entry.get('folders') 
+        if folders is None: 
+            folders = [] 
+        elif isinstance(folders, str): 
+            folders = folders.split(';') 
+        elif not isinstance(folders, list) or not all(isinstance(name, str) for name in folders): 
+            raise ValueError(f"قيمة folders في العنصر {idx} يجب أن تكون نصاً أو قائمة أسماء مجلدات") 
+        folders = [name.strip() for name in folders if name.strip()] 
+ 
+        order = str(entry.get('order') or '').strip().lower() 
+        if order and order not in BATCH_IMAGE_ORDERS: 
+            raise ValueError(f"قيمة order غير معروفة في العنصر {idx}: {order}") 
+ 
+        mismatch_action = str(entry.get('mismatch') or 'truncate').strip().lower() 
+        if mismatch_action not in BATCH_MISMATCH_ACTIONS: 
+            raise ValueError(f"قيمة mismatch غير معروفة في العنصر {idx}: {mismatch_action}") 
+ 
+        jobs.append({ 
+            'output': output, 
+            'template': template, 
+            'folders': folders, 
+            'image_order': BATCH_IMAGE_ORDERS[order] if order else default_image_order, 
+            'mismatch_action': mismatch_action 
+        }) 
+ 
+    if not jobs: 
+        raise ValueError("ملف الوصف لا يحتوي على أي عرض") 
+    return jobs 
+ 
+ 
+def run_batch(jobs, folder_paths, templates, save_options, results_path, on_progress=None): 
+    """ 
+    إنشاء جميع العروض في عملية واحدة مع مشاركة القوالب المحللة بينها، 
+    وكتابة كل عرض مباشرة في ملف ZIP للنتائج على القرص (results_path)، وإرجاع ملخص كل عرض 
+    """ 
+    template_pool = get_template_pool() 
+    folders_by_name = {os.path.basename(fp): fp for fp in folder_paths} 
+    summary = [] 
+ 
+    # ملفات pptx مضغوطة أصلاً، لذلك تُخزن في ملف النتائج بدون ضغط إضافي 
+    with zipfile.ZipFile(results_path, "w", compression=zipfile.ZIP_STORED) as results_zip: 
+        for job_idx, job in enumerate(jobs): 
+            if on_progress: 
+                on_progress(job_idx, job['output']) 
+            add_detail(f"🔄 بدء إنشاء العرض: {job['output']}", "info") 
+ 
+            try: 
+                template_bytes = templates.get(job['template']) 
+                if template_bytes is None: 
+                    raise ValueError(f"القالب غير موجود: {job['template']}") 
+ 
+                if job['folders']: 
+                    missing = [name for name in job['folders'] if name not in folders_by_name] 
+                    if missing: 
+                        raise ValueError(f"مجلدات غير موجودة: {', '.join(missing)}") 
+                    job_folders = [folders_by_name[name] for name in job['folders']] 
+                else: 
+                    job_folders = folder_paths 
+ 
+                # تجهيز نسخة القالب التالية في الخلفية فقط إذا كانت عروض لاحقة تستخدمه 
+                reuse_expected = any(later['template'] == job['template'] for later in jobs[job_idx + 1:]) 
+                prs = template_pool.checkout(template_bytes, reuse_expected=reuse_expected) 
+                ok, analysis_result = analyze_first_slide(prs) 
+                if not ok: 
+                    raise ValueError(analysis_result) 
+ 
+                template_shapes_info, template_positions, slide_layout = prepare_template(prs, analysis_result) 
+                expected_count = max(len(template_shapes_info), len(template_positions)) 
+                if job['mismatch_action'] == 'stop' and find_mismatch_folders(job_folders, expected_count): 
+                    raise ValueError("تم إيقاف العرض لوجود اختلاف في عدد الصور (mismatch=stop)") 
+ 
+                created_slides, total_replaced = build_deck( 
+                    prs, job_folders, slide_layout, 
+                    template_shapes_info, template_positions, job['mismatch_action'], 
+                    job['image_order'] 
+                ) 
+                if created_slides == 0: 
+                    raise ValueError("لم يتم إضافة أي شرائح") 
+ 
+                # الكتابة مباشرة داخل ملف النتائج بدل تجهيز كل عرض في الذاكرة 
+                with results_zip.open(job['output'], 'w') as output_file: 
+                    save_presentation(prs, output_file, **save_options) 
+ 
+                add_detail(f"✅ تم إنشاء العرض '{job['output']}': {created_slides} شريحة، {total_replaced} صورة", "success") 
+                summary.append({ 
+                    'output': job['output'], 
+                    'status': 'success', 
+                    'slides': created_slides, 
+                    'images': total_replaced 
+                }) 
+            except Exception as e: 
+                add_detail(f"❌ فشل في إنشاء العرض '{job['output']}': {e}", "error") 
+                summary.append({ 
+                    'output': job['output'], 
+                    'status': f'failed: {e}', 
+                    'slides': 0, 
+                    'images': 0 
+                }) 
+ 
+    if on_progress: 
+        on_progress(len(jobs), None) 
+ 
+    return summary 
+ 
+ 
+def batch_main(): 
+    if uploaded_zip: 
+        if st.button("🚀 بدء معالجة الدفعة"): 
+            # مسح التفاصيل السابقة 
+            clear_details() 
+ 
+            temp_dir = None 
+            try: 
+                temp_dir = tempfile.mkdtemp(prefix="batch_images_") 
+                with zipfile.ZipFile(io.BytesIO(uploaded_zip.getvalue()), "r") as zip_ref: 
+                    zip_ref.extractall(temp_dir) 
+                add_detail("📂 تم استخراج الملف المضغوط بنجاح", "success") 
+ 
+                # القوالب: من داخل الملف المضغوط (بالمسار النسبي) ومن الملفات المرفوعة (بالاسم) 
+                templates = {} 
+                for dir_path, _, file_names in os.walk(temp_dir): 
+                    for file_name in file_names: 
+                        if file_name.lower().endswith('.pptx'): 
+                            file_path = os.path.join(dir_path, file_name) 
+                            relative_path = os.path.relpath(file_path, temp_dir).replace(os.sep, '/') 
+                            with open(file_path, 'rb') as template_file: 
+                                templates[relative_path] = template_file.read() 
+                for template_upload in uploaded_templates or []: 
+                    templates[template_upload.name] = template_upload.getvalue() 
+ 
+                # ملف الوصف: المرفوع أولاً، وإلا من جذر الملف المضغوط 
+                if uploaded_manifest: 
+                    manifest_name, manifest_data = uploaded_manifest.name, uploaded_manifest.getvalue() 
+                else: 
+                    manifest_name, manifest_data = None, None 
+                    for name in BATCH_MANIFEST_NAMES: 
+                        manifest_path = os.path.join(temp_dir, name) 
+                        if os.path.isfile(manifest_path): 
+                            with open(manifest_path, 'rb') as manifest_file: 
+                                manifest_name, manifest_data = name, manifest_file.read() 
+                            break 
+ 
+                if manifest_data is None: 
+                    st.error("❌ لم يتم العثور على ملف وصف (manifest.json أو manifest.csv).") 
+                    add_detail("❌ لم يتم العثور على ملف وصف", "error") 
+                    show_details_section() 
+                    st.stop() 
+ 
+                try: 
+                    jobs = load_batch_manifest(manifest_name, manifest_data, image_order_option) 
+                except ValueError as e: 
+                    st.error(f"❌ ملف الوصف غير صالح: {e}") 
+                    add_detail(f"❌ ملف الوصف غير صالح: {e}", "error") 
+                    show_details_section() 
+                    st.stop() 
+                add_detail(f"🧾 ملف الوصف يحتوي على {len(jobs)} عرض", "info") 
+ 
+                folder_paths = find_image_folders(temp_dir) 
+                if not folder_paths: 
+                    st.error("❌ لا توجد مجلدات تحتوي على صور في الملف المضغوط.") 
+                    add_detail("❌ لا توجد مجلدات تحتوي على صور في الملف المضغوط", "error") 
+                    show_details_section() 
+                    st.stop() 
+ 
+                progress_bar = st.progress(0) 
+                status_text = st.empty() 
+ 
+                def update_progress(job_idx, output_name): 
+                    progress_bar.progress(job_idx / len(jobs)) 
+                    if output_name: 
+                        status_text.text(f"🔄 إنشاء العرض {job_idx + 1}/{len(jobs)}: {output_name}") 
+ 
+                save_options = { 
+                    'xml_compresslevel': xml_compresslevel_option, 
+                    'store_media': store_media_option, 
+                    'parallel': parallel_save_option 
+                } 
+                results_fd, results_path = tempfile.mkstemp(prefix="batch_results_", suffix=".zip", dir=temp_dir) 
+                os.close(results_fd) 
+                summary = run_batch(jobs, folder_paths, templates, save_options, results_path, update_progress) 
+ 
+                progress_bar.empty() 
+                status_text.empty() 
+ 
+                built_count = sum(1 for item in summary if item['status'] == 'success') 
+                col1, col2, col3 = st.columns(3) 
+                with col1: st.metric("العروض المُنشأة", built_count) 
+                with col2: st.metric("العروض الفاشلة", len(summary) - built_count) 
+                with col3: st.metric("الشرائح المُضافة", sum(item['slides'] for item in summary)) 
+                st.table(summary) 
+ 
+                if built_count == 0: 
+                    st.error("❌ لم يتم إنشاء أي عرض.") 
+                    show_details_section() 
+                    st.stop() 
+ 
+                st.success(f"🎉 تم إنشاء {built_count} عرض من أصل {len(jobs)}") 
+                with open(results_path, 'rb') as results_file: 
+                    st.download_button( 
+                        label="⬇️ تحميل جميع العروض (ZIP)", 
+                        data=results_file, 
+                        file_name="batch_results.zip", 
+                        mime="application/zip", 
+                        key="batch_download_button" 
+                    ) 
+ 
+                show_details_section() 
+ 
+            except Exception as e: 
+                st.error(f"❌ خطأ أثناء معالجة الدفعة: {e}") 
+                add_detail(f"❌ خطأ عام أثناء معالجة الدفعة: {e}", "error") 
+                show_details_section() 
+            finally: 
+                if temp_dir and os.path.exists(temp_dir): 
+                    try: 
+                        shutil.rmtree(temp_dir) 
+                        add_detail("🧹 تم تنظيف الملفات المؤقتة", "info") 
+                    except Exception as cleanup_error: 
+                        add_detail(f"⚠ خطأ في تنظيف الملفات المؤقتة: {cleanup_error}", "warning") 
+    else: 
+        st.info("📋 يُرجى رفع ملف ZIP يحتوي على مجلدات الصور وملف الوصف للبدء") 
+ 
+        with st.expander("📖 تعليمات وضع الدفعة"): 
+            st.markdown(""" 
+            ### كيفية استخدام وضع الدفعة: 
+ 
+            1.  **ملف ZIP:** 
+                - يحتوي على مجلدات الصور (كل مجلد = شريحة). 
+                - يمكن أن يحتوي أيضاً على قوالب PowerPoint وعلى ملف الوصف `manifest.json` أو `manifest.csv` في الجذر. 
+ 
+            2.  **ملف الوصف (CSV أو JSON):** كل سطر/عنصر يصف عرضاً واحداً: 
+                - `output`: اسم الملف الناتج (اسم فقط بدون مسار، ولا يتكرر). 
+                - `template`: مسار القالب داخل ملف ZIP أو اسم قالب مرفوع. 
+                - `folders`: (اختياري) المجلدات المطلوبة بالترتيب، مفصولة بـ `;` في CSV أو قائمة في JSON. الافتراضي: جميع المجلدات. 
+                - `order`: (اختياري) `sorted` أو `random` لترتيب الصور داخل كل مجلد. 
+                - `mismatch`: (اختياري) `truncate` أو `repeat` أو `skip_folder` أو `stop`. الافتراضي: `truncate`. 
+ 
+            3.  **النتيجة:** 
+                - ملف ZIP واحد يحتوي على جميع العروض المُنشأة. 
+ 
+            ### مثال CSV: 
+            ``` 
+            output,template,folders,order,mismatch 
+            North.pptx,templates/main.pptx,Cairo;Alexandria,sorted,truncate 
+            South.pptx,templates/main.pptx,Aswan;Luxor,random,repeat 
+            ``` 
+            """) 
+ 
+ 
 def main(): 
     if uploaded_pptx and uploaded_zip: 
         if "process_started" not in st.session_state: 
             st.session_state.process_started = False 
  
-        if st.button("🚀 بدء المعالجة") or st.session_state.process_started: 
+        start_clicked = st.button("🚀 بدء المعالجة") 
+        if start_clicked or st.session_state.process_started: 
             st.session_state.process_started = True 
              
             # مسح التفاصيل السابقة 
@@ -480,18 +1090,7 @@ def main():
                  
                 add_detail("📂 تم استخراج الملف المضغوط بنجاح", "success") 
                  
-                all_items = os.listdir(temp_dir) 
-                folder_paths = [] 
-                 
-                for item in all_items: 
-                    item_path = os.path.join(temp_dir, item) 
-                    if os.path.isdir(item_path): 
-                        # التحقق من وجود صور في المجلد 
-                        imgs_in_folder = [f for f in os.listdir(item_path)  
-                                        if f.lower().endswith(('.png', '.jpg', '.jpeg', '.gif', '.bmp', '.tiff', '.webp'))] 
-                        if imgs_in_folder: 
-                            folder_paths.append(item_path) 
-                            add_detail(f"📁 المجلد '{item}' يحتوي على {len(imgs_in_folder)} صورة", "info") 
+                folder_paths = find_image_folders(temp_dir) 
                  
                 if not folder_paths: 
                     st.error("❌ لا توجد مجلدات تحتوي على صور في الملف المضغوط.") 
@@ -500,10 +1099,13 @@ def main():
                     show_details_section() 
                     st.stop() 
                  
-                folder_paths.sort() 
                 add_detail(f"✅ تم العثور على {len(folder_paths)} مجلد يحتوي على صور", "success") 
  
-                prs = Presentation(io.BytesIO(uploaded_pptx.read())) 
+                # يُحتسب استخدام القالب مرة واحدة لكل ضغطة على زر البدء، لا لكل إعادة تشغيل للسكربت 
+                prs = get_template_pool().checkout( 
+                    uploaded_pptx.getvalue(), 
+                    reuse_expected=None if start_clicked else False 
+                ) 
                  
                 add_detail("🔍 بدء تحليل الشريحة الأولى", "info") 
                  
@@ -518,24 +1120,11 @@ def main():
                 add_detail("✅ تم تحليل الشريحة الأولى بنجاح", "success") 
                 add_detail(f"📊 تفاصيل التحليل: {analysis_result['placeholders']} placeholders، {analysis_result['regular_pictures']} صور عادية، {analysis_result['total_slots']} إجمالي", "info") 
                  
-                first_slide = prs.slides[0] 
-                template_shapes_info = get_image_shapes_info(first_slide) 
-                template_positions = get_template_image_positions(first_slide) 
-                 
-                if not template_shapes_info and not template_positions: 
-                    add_detail("⚠ الشريحة الأولى لا تحتوي على مواضع صور", "warning") 
-                    slide_layout = prs.slide_layouts[6]  # Blank layout 
-                else: 
-                    slide_layout = analysis_result['slide_layout'] 
+                template_shapes_info, template_positions, slide_layout = prepare_template(prs, analysis_result) 
  
                 # فحص التطابق في عدد الصور 
                 expected_count = max(len(template_shapes_info), len(template_positions)) 
-                mismatch_folders = [] 
-                for fp in folder_paths: 
-                    imgs = [f for f in os.listdir(fp)  
-                           if f.lower().endswith(('.png', '.jpg', '.jpeg', '.gif', '.bmp', '.tiff', '.webp'))] 
-                    if len(imgs) != expected_count: 
-                        mismatch_folders.append((os.path.basename(fp), len(imgs), expected_count)) 
+                mismatch_folders = find_mismatch_folders(folder_paths, expected_count) 
                  
                 if mismatch_folders and 'mismatch_action' not in st.session_state: 
                     # إظهار التحذير والتفاصيل 
@@ -588,36 +1177,19 @@ def main():
                 # معالجة صامتة للشرائح 
                 add_detail("🔄 بدء إضافة الشرائح الجديدة", "info") 
                  
-                total_replaced = 0 
-                created_slides = 0 
- 
                 progress_bar = st.progress(0) 
                 status_text = st.empty() 
  
-                for folder_idx, folder_path in enumerate(folder_paths): 
-                    folder_name = os.path.basename(folder_path) 
-                    status_text.text(f"🔄 معالجة المجلد {folder_idx + 1}/{len(folder_paths)}: {folder_name}") 
-                    add_detail(f"🔄 بدء معالجة المجلد: {folder_name}", "info") 
- 
-                    try: 
-                        # إنشاء شريحة جديدة 
-                        new_slide = prs.slides.add_slide(slide_layout) 
-                        created_slides += 1 
-                        add_detail(f"📄 تم إنشاء شريحة جديدة للمجلد: {folder_name}", "success") 
-                         
-                        # معالجة صور المجلد مع الحفاظ على التنسيقات 
-                        replaced_count = process_folder_images( 
-                            new_slide, folder_path, folder_name,  
-                            template_shapes_info, template_positions, mismatch_action 
-                        ) 
-                         
-                        total_replaced += replaced_count 
-                        add_detail(f"✅ تم إنشاء شريحة للمجلد '{folder_name}' واستبدال {replaced_count} صورة", "success") 
-                     
-                    except Exception as e: 
-                        add_detail(f"❌ خطأ في معالجة المجلد {folder_name}: {e}", "error") 
+                def update_progress(folder_idx, folder_name): 
+                    progress_bar.progress(folder_idx / len(folder_paths)) 
+                    if folder_name: 
+                        status_text.text(f"🔄 معالجة المجلد {folder_idx + 1}/{len(folder_paths)}: {folder_name}") 
  
-                    progress_bar.progress((folder_idx + 1) / len(folder_paths)) 
+                created_slides, total_replaced = build_deck( 
+                    prs, folder_paths, slide_layout, 
+                    template_shapes_info, template_positions, mismatch_action, 
+                    image_order_option, on_progress=update_progress 
+                ) 
  
                 progress_bar.empty() 
                 status_text.empty() 
@@ -648,7 +1220,12 @@ def main():
                 original_name = os.path.splitext(uploaded_pptx.name)[0] 
                 output_filename = f"{original_name}_Updated.pptx" 
                 output_buffer = io.BytesIO() 
-                prs.save(output_buffer) 
+                save_presentation( 
+                    prs, output_buffer, 
+                    xml_compresslevel=xml_compresslevel_option, 
+                    store_media=store_media_option, 
+                    parallel=parallel_save_option 
+                ) 
                 output_buffer.seek(0) 
  
                 st.success(f"✅ تم إنشاء ملف PowerPoint جديد بـ {created_slides} شريحة مع الحفاظ على جميع التنسيقات!") 
@@ -709,5 +1286,8 @@ def main():
             """) 
  
 if __name__ == '__main__': 
-    main()
-"
+    warm_up_worker() 
+    if batch_mode: 
+        batch_main() 
+    else: 
+        main()